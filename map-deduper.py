@@ -21,37 +21,105 @@ De-duplicate Map items and recover lost ones
 https://minecraft.fandom.com/wiki/Map_item_format
 """
 import argparse
+import collections
+import concurrent.futures
+import functools
+import gzip
+import io
+import itertools
+import json
 import logging
+import mmap
+import operator
+import os
 import pathlib
-from pprint import pprint, pformat
+from pprint import pprint
+import struct
 import sys
 import typing as t
+import zlib
 
 import numpy as np
 import mcworldlib as mc
+import tqdm
 
 if t.TYPE_CHECKING:
     ...
 
 log = logging.getLogger(__name__)
-AllMaps: 't.TypeAlias' = t.Dict[int, 'Map']
+AnyMap: 't.TypeAlias' = t.Union['Map', 'MapSummary']
+AllMaps: 't.TypeAlias' = t.Dict[int, 'MapSummary']
+
+REFS_CACHE = ".map-deduper-refs.json"  # In World folder
+CHAIN = "+"  # Command line separator for chained commands
+
+# Parsed once, as they're compared against every diff when merging maps
+COLORS_PATH = mc.Path("data.colors")
+DATA_VERSION_KEY = (mc.Path(), "DataVersion")  # (path, key) as in TagDiff
+
+# How a 'map' tag name is serialized in NBT: big-endian unsigned short length + UTF-8
+MAP_TAG_NAME = struct.pack('>H', 3) + b'map'
+CHUNK_DECOMPRESS = {1: gzip.decompress, 2: zlib.decompress, 3: bytes}  # by compression
+
+# Tags that never hold items, and so no Map references, never walked into.
+# Denied rather than allowing only known item containers, as missing a single
+# reference would make defrag leave it pointing to the wrong map
+NO_ITEMS_TAGS = frozenset((
+    # Chunk terrain data, both pre-1.18 names, inside 'Level', and 1.18+ ones
+    'Sections', 'sections', 'Heightmaps', 'Structures', 'structures', 'Biomes',
+    'Lights', 'PostProcessing', 'LiquidsToBeTicked', 'ToBeTicked', 'LiquidTicks',
+    'TileTicks', 'block_ticks', 'fluid_ticks', 'CarvingMasks', 'blending_data',
+    'below_zero_retrogen', 'UpgradeData',
+    # Mob and player state
+    'Brain', 'Attributes', 'attributes', 'ActiveEffects', 'active_effects',
+    'Gossips', 'recipeBook', 'abilities', 'warden_spawn_tracker',
+))
+
+# Raw NBT scanning, by tag ID
+NBT_SCALARS = {tagid: struct.Struct(fmt) for tagid, fmt in
+               ((1, '>b'), (2, '>h'), (3, '>i'), (4, '>q'), (5, '>f'), (6, '>d'))}
+NBT_ARRAYS = {7: 1, 11: 4, 12: 8}  # item size
+NBT_LENGTH = struct.Struct('>i')
+NBT_STRLEN = struct.Struct('>H')
 
 
 # -----------------------------------------------------------------------------
 # CLI functions
 
 def main(argv=None):
-    args = parse_args(argv)
-    logging.basicConfig(level=args.loglevel, format='%(levelname)s: %(message)s')
-    log.debug(args)
-
-    if args.cmd:
-        args.f(**vars(args))
-        return
-
-
-def parse_args(args=None):
-    parser = mc.basic_parser(description=__doc__)
+    # Several commands can be chained in a single run, e.g. 'lost -i + search',
+    # sharing the World, Maps and references loaded by the previous ones.
+    # Parse them all before running any, so a typo doesn't leave a job half-done
+    argv = sys.argv[1:] if argv is None else argv
+    cmdlines = [list(group) for is_chain, group in
+                itertools.groupby(argv, key=lambda _: _ == CHAIN) if not is_chain]
+    chain: t.List[argparse.Namespace] = []
+    for cmdline in cmdlines or [[]]:
+        # Global options are inherited from the previous command, but not the command
+        namespace = argparse.Namespace(**vars(chain[-1])) if chain else None
+        if namespace:
+            del namespace.cmd
+        chain.append(parse_args(cmdline, namespace))
+
+    logging.basicConfig(format='%(levelname)s: %(message)s')
+    for args in chain:
+        # Each command has its own --verbose/--quiet, inherited from the previous one
+        logging.getLogger().setLevel(args.loglevel)
+        log.debug(args)
+        if args.cmd:
+            args.f(**vars(args))
+        if args.cmd in ('merge', 'dedupe', 'defrag'):
+            # World is kept, as it's updated in place, but not Maps and references
+            get_all_maps.cache_clear()
+            get_cached_map_refs.cache_clear()
+
+
+def parse_args(args=None, namespace=None) -> argparse.Namespace:
+    parser = mc.basic_parser(description=__doc__,
+                             epilog=f"Commands can be chained with '{CHAIN}'"
+                                    f", as in 'lost {CHAIN} search'")
+    parser.add_argument('--progress', action='store_true',
+                        help="Show a progress bar while searching map references.")
     commands = parser.add_subparsers(dest='cmd')
 
     # Frequent subcommand arguments
@@ -61,11 +129,22 @@ def parse_args(args=None):
     maps = argparse.ArgumentParser(add_help=False)
     maps.add_argument('maps', nargs='+', type=int, help="Map IDs")
 
+    map_list = argparse.ArgumentParser(add_help=False)
+    map_list.add_argument('--ids-only', '-i', action='store_true',
+                          help="Print only Map IDs, without loading map files.")
+    map_list.add_argument('--pretty', '-P', action='store_true',
+                          help="Pretty-print maps as a list, slower for many maps.")
+
     # Subcommands
-    commands.add_parser('list',   help="List all maps").set_defaults(f=list_maps)
-    commands.add_parser('show',   help="Print map data", parents=[maps]).set_defaults(f=show_maps)
+    commands.add_parser('list',   help="List all maps",
+                        parents=[map_list]).set_defaults(f=list_maps)
+    show = commands.add_parser('show', help="Print map data", parents=[maps])
+    show.add_argument('--summary', '-s', action='store_true',
+                      help="Print a histogram of colors instead of every pixel.")
+    show.set_defaults(f=show_maps)
     commands.add_parser('search', help="Search all map references").set_defaults(f=search_maps)
-    commands.add_parser('lost',   help="Find maps with no reference").set_defaults(f=lost_maps)
+    commands.add_parser('lost',   help="Find maps with no reference",
+                        parents=[map_list]).set_defaults(f=lost_maps)
     commands.add_parser('dupes',  help="List map duplicates").set_defaults(f=print_dupes)
     commands.add_parser('merge',  help="Merge into a target map data from other maps",
                         parents=[mapid, maps]).set_defaults(f=merge)
@@ -74,18 +153,22 @@ def parse_args(args=None):
     commands.add_parser('idcounts', help="Update idcounts.dat with a given map ID",
                         parents=[mapid]).set_defaults(f=update_idcounts)
 
-
-    return parser.parse_args(args)
+    return parser.parse_args(args, namespace)
 
 
-def list_maps(world: str, _all_maps=None, _label="", **_kw):
+def list_maps(world: str, ids_only=False, pretty=False, _all_maps=None, _label="", **_kw):
+    if ids_only and _all_maps is None:
+        map_ids = Map.get_ids(load_world(world))
+        log.info("%s map IDs:", _label or "All")
+        pprint(map_ids, compact=True)
+        return
     all_maps = get_all_maps(world) if _all_maps is None else _all_maps
     log.info("%s maps:", _label or "All")
-    pprint(list(all_maps.values()))
+    print_maps(all_maps.values(), pretty=pretty)
 
 
-def show_maps(world: str, maps: list, **_kw):
-    world = mc.load(world)
+def show_maps(world: str, maps: list, summary=False, **_kw):
+    world = load_world(world)
     for mapid in maps:
         try:
             mapitem = Map.load_by_id(mapid, world)
@@ -93,29 +176,45 @@ def show_maps(world: str, maps: list, **_kw):
             log.error(e)
             continue
         log.info("Map %d: %s", mapid, mapitem.filename)
-        mc.pretty(mapitem)
+        if not summary:
+            mc.pretty(mapitem)
+            continue
+        # Shallow copies, so the 16K pixels are neither formatted nor copied
+        root, data = mc.Compound(mapitem), mc.Compound(mapitem.data)
+        colors = np.asarray(data.pop('colors')).view(np.uint8)
+        root['data'] = data
+        mc.pretty(root)
+        print("Colors:", {color: count for color, count in
+                          enumerate(np.bincount(colors, minlength=256).tolist()) if count})
 
 
-def search_maps(world: str, _all_maps=None, _map_refs=None, **_kw):
-    world = mc.load(world)
-    all_maps = Map.load_all(world) if _all_maps is None else _all_maps
-    map_refs, partial = get_map_refs(world) if _map_refs is None else _map_refs
+def search_maps(world: str, progress=False, _all_maps=None, _map_refs=None, **_kw):
+    all_maps = get_all_maps(world) if _all_maps is None else _all_maps
+    map_refs, partial = (get_cached_map_refs(load_world(world), progress=progress)
+                         if _map_refs is None else _map_refs)
     log.info("Map references%s:", " (partial)" if partial else "")
+    lines: t.List[str] = []  # written at once, much faster than a print() per line
     for mapitem in all_maps.values():
-        print(mapitem)
-        for data in map_refs.get(mapitem.mapid, []):
-            print(f"\t{data.path}\t{data.fqtag.path[data.fqtag.key]}")
+        lines.append(f"{mapitem}\n")
         if mapitem.mapid in map_refs:
-            print()
-
-
-def lost_maps(world: str, _all_maps=None, _map_refs=None, **_kw):
-    world = mc.load(world)
-    all_maps = Map.load_all(world) if _all_maps is None else _all_maps
-    map_refs, partial = get_map_refs(world) if _map_refs is None else _map_refs
+            lines.extend(f"\t{ref.path}\t{ref.tagpath}\n" for ref in map_refs[mapitem.mapid])
+            lines.append("\n")
+    sys.stdout.write("".join(lines))
+
+
+def lost_maps(world: str, ids_only=False, pretty=False, progress=False,
+              _all_maps=None, _map_refs=None, **_kw):
+    map_refs, partial = (get_cached_map_refs(load_world(world), progress=progress)
+                         if _map_refs is None else _map_refs)
+    if ids_only and _all_maps is None:
+        log.info("Lost map IDs%s:", " in partial data" if partial else "")
+        pprint([mapid for mapid in Map.get_ids(load_world(world))
+                if mapid not in map_refs], compact=True)
+        return
+    all_maps = get_all_maps(world) if _all_maps is None else _all_maps
     map_lost = [all_maps[mapid] for mapid in all_maps if mapid not in map_refs]
     log.info("Lost maps%s:", " in partial data" if partial else "")
-    pprint(map_lost)
+    print_maps(map_lost, pretty=pretty)
 
 
 def print_dupes(world: str, _dupes_map=None, **_kw):
@@ -123,14 +222,16 @@ def print_dupes(world: str, _dupes_map=None, **_kw):
     if dupes_map is None:
         dupes_map = dict(get_duplicates(get_all_maps(world)))
     log.info("Map Duplicates:")
+    lines: t.List[str] = []  # written at once, much faster than a print() per line
     for key, dupes in dupes_map.items():
-        print(key)
-        for dupe in sorted(dupes):
-            print(f"\t{dupe}")
+        lines.append(f"{key}\n")
+        # Already by ID, as duplicates keep the order of all maps, loaded by ID
+        lines.extend(f"\t{dupe}\n" for dupe in dupes)
+    sys.stdout.write("".join(lines))
 
 
 def merge(world: str, mapid: int, maps: t.List[int], **_kw):
-    world = mc.load(world)
+    world = load_world(world)
     target = Map.load_by_id(mapid, world)
     sources = [Map.load_by_id(_, world) for _ in maps]
     if not sources:
@@ -149,7 +250,7 @@ def merge(world: str, mapid: int, maps: t.List[int], **_kw):
 # move 116 to 112, 117 to 113
 # update refs 116 to 112, 117 to 113
 # update idcounts.dat to 114
-def dedupe(world: str, **_kw) -> None:
+def dedupe(world: str, progress=False, **_kw) -> None:
     """De-duplicate maps list by merging pixels and removing unreferenced maps
 
     - For each set of duplicates, choose a suitable target and candidate sources
@@ -165,18 +266,19 @@ def dedupe(world: str, **_kw) -> None:
         - Update final idcounts.dat
     """
     # Find Duplicates
-    world = mc.load(world)
+    world = load_world(world)
     log.info("De-duplicating Player maps in World %r", world.name)
     all_maps = Map.load_all(world)  # for defrag_maps()
     maps = {k: v for k, v in all_maps.items() if v.is_player}
-    log.debug("Player maps:\n%s", pformat(list(maps.values())))
+    if log.isEnabledFor(logging.DEBUG):  # don't format all maps just to discard them
+        log.debug("Player maps:\n%s", "\n".join(map(repr, maps.values())))
     dupes_map = dict(get_duplicates(maps))
     if not dupes_map:
         log.info("No duplicate maps!")
         return
 
     # Choose Target and Candidates
-    sources : t.Dict[int, t.Tuple[Map, Map, t.List[MapPixel]]] = {}
+    sources : t.Dict[int, t.Tuple[Map, Map, MapPixels]] = {}
     # Sources ordering is important not only to select the correct target,
     # but also to apply pixels from least to most significant source.
     # So always loop sources by insertion order and don't re-sort it
@@ -199,7 +301,7 @@ def dedupe(world: str, **_kw) -> None:
 
     # Rule out sources with references in world
     # This is important, as we're not updating references from source to target!
-    refs, partial = get_map_refs(world)
+    refs, partial = get_cached_map_refs(world, progress=progress)
     if partial:
         log.warning("World scanning aborted, changes will not be applied")
     sources = {mapid: sources[mapid] for mapid in sources if mapid not in refs}
@@ -209,7 +311,7 @@ def dedupe(world: str, **_kw) -> None:
 
     # Merge and delete
     for source, target, pixels in sources.values():
-        if pixels:
+        if len(pixels):
             log.info("Merging %d pixels from %s into target %s",
                      len(pixels), source, target)
             apply_pixels(target, pixels)
@@ -222,12 +324,13 @@ def dedupe(world: str, **_kw) -> None:
             filename.rename(filename.with_suffix(".bak"))
 
     # Defragment - intentionally don't share all_maps to force re-scan
-    defrag_maps(world, all_maps=None, all_refs=refs, partial_refs=partial)
+    defrag_maps(world, all_maps=None, progress=progress)
 
 
-def defrag(world: str, _world: mc.World = None, _all_maps=None, _map_refs=None, **_kw):
-    world = mc.load(world) if _world is None else _world
-    defrag_maps(world, all_maps=_all_maps, all_refs=_map_refs)
+def defrag(world: str, progress=False, _world: mc.World = None, _all_maps=None,
+           _map_refs=None, **_kw):
+    world = load_world(world) if _world is None else _world
+    defrag_maps(world, all_maps=_all_maps, all_refs=_map_refs, progress=progress)
 
 
 # -----------------------------------------------------------------------------
@@ -254,49 +357,51 @@ class Map(mc.File):
                              1: mc.THE_END,
     }
 
-    @property
-    def data_version(self) -> int:
-        return int(self['DataVersion'])
-
     @property
     def data(self) -> mc.Compound:
         return self['data']
 
-    @property
+    # Properties below are derived from tags never changed by this tool, only
+    # 'data.colors' is, so they are safe to cache for the lifetime of the Map
+    @functools.cached_property
     def mapid(self) -> int:
-        return int(self.filename.stem.split('_')[-1])
+        return self.id_from_path(self.filename)
 
-    @property
+    @functools.cached_property
+    def data_version(self) -> int:
+        return int(self['DataVersion'])
+
+    @functools.cached_property
     def center(self) -> mc.FlatPos:
         return mc.FlatPos.from_tag(self.data, suffix='Center')
 
-    @property
+    @functools.cached_property
     def dimension(self) -> mc.Dimension:
         return self.dim_map[self.data['dimension']]
 
-    @property
+    @functools.cached_property
     def is_player(self) -> bool:
         return self.data['unlimitedTracking'] == 0  # 1 otherwise
 
-    @property
+    @functools.cached_property
     def is_treasure(self) -> bool:
         # More efficient than category == 'Treasure', duplicates .get_category() logic
         return not self.is_player and self.scale == 1
 
-    @property
+    @functools.cached_property
     def is_explorer(self) -> bool:
         # More efficient than category == 'Explorer', duplicates .get_category() logic
         return not self.is_player and self.scale == 2
 
-    @property
+    @functools.cached_property
     def category(self) -> str:
         return self.get_category(self.key)
 
-    @property
+    @functools.cached_property
     def scale(self) -> int:
         return int(self.data['scale'])
 
-    @property
+    @functools.cached_property
     def key(self) -> MapKey:
         return MapKey(
             dimension = self.dimension,
@@ -306,9 +411,15 @@ class Map(mc.File):
         )
 
     @classmethod
-    def load(cls, filename: mc.AnyPath, *args, **kwargs) -> 'Map':
-        self: 'Map' = super().load(filename, *args, **kwargs)
-        self.filename = pathlib.Path(self.filename)
+    def load(cls, filename: mc.AnyPath) -> 'Map':
+        # Map files are small, so read and decompress each at once. Parsing straight
+        # from a GzipFile, as nbtlib does, takes about twice as long due to its many
+        # tiny reads, each going through Python-level gzip buffering
+        with open(filename, 'rb') as fd:
+            self: 'Map' = cls.parse(io.BytesIO(gzip.decompress(fd.read())))
+        self.gzipped = True  # as mc.File.load() would set, so save() compresses it
+        self.mapid = cls.id_from_path(filename)  # pre-fill the cached property
+        self.filename = pathlib.Path(filename)
         assert self.data['trackingPosition'] == 1
         return self
 
@@ -317,18 +428,41 @@ class Map(mc.File):
         return pathlib.Path(world.path, f'data/map_{mapid}.dat')
 
     @classmethod
-    def load_by_id(cls, mapid: int, world: mc.World, *args, **kwargs) -> 'Map':
+    def load_by_id(cls, mapid: int, world: mc.World) -> 'Map':
         try:
-            return cls.load(cls.path_by_id(mapid, world=world), *args, **kwargs)
+            return cls.load(cls.path_by_id(mapid, world=world))
         except FileNotFoundError as e:
             raise mc.MCError(f"Map {mapid} not found in world {world.name!r}: {e}")
 
     @classmethod
-    def load_all(cls, world: mc.World) -> t.Dict[int, 'Map']:
-        maps: t.List['Map'] = [cls.load(path) for path in
-                               pathlib.Path(world.path, 'data').glob("map_*.dat")]
-        # Glob doesn't sort properly, so make sure insertion order by Map ID
-        all_maps: t.Dict[int, 'Map'] = {item.mapid: item for item in sorted(maps)}
+    def id_from_path(cls, path: mc.AnyPath) -> int:
+        return int(os.path.splitext(os.path.basename(path))[0].rpartition('_')[2])
+
+    @classmethod
+    def get_paths(cls, world: mc.World) -> t.List[str]:
+        # Faster than pathlib's glob(), no Path objects and no fnmatch per entry
+        with os.scandir(os.path.join(world.path, 'data')) as entries:
+            return [entry.path for entry in entries
+                    if entry.name.startswith('map_') and entry.name.endswith('.dat')]
+
+    @classmethod
+    def get_ids(cls, world: mc.World) -> t.List[int]:
+        """Sorted IDs of all maps in World, from their filenames only"""
+        return sorted(cls.id_from_path(path) for path in cls.get_paths(world))
+
+    @classmethod
+    def load_all(cls, world: mc.World, summary=False) -> t.Dict[int, AnyMap]:
+        """All maps in World by ID, either fully loaded or only as MapSummary"""
+        # Directory listing is not sorted, so make sure insertion order by Map ID.
+        # Sort the paths, as executor.map() preserves order, no need to sort Maps
+        paths = sorted(cls.get_paths(world), key=cls.id_from_path)
+        loader = MapSummary.load if summary else cls.load
+        # nbtlib parsing is pure Python, so a process pool would spend as much time
+        # pickling the Maps back as loading them. Threads still overlap file I/O and
+        # gzip decompression, both of which release the GIL.
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            all_maps: t.Dict[int, AnyMap] = {item.mapid: item for item in
+                                           executor.map(loader, paths)}
         return all_maps
 
     @classmethod
@@ -354,7 +488,66 @@ class Map(mc.File):
     __str__ = __repr__
 
 
-MapPixel: 't.TypeAlias' = t.Tuple[int, mc.Byte]  # Index, Value in 'data.colors'
+class MapSummary(t.NamedTuple):
+    """Read-only subset of a Map, enough to list it and find its duplicates"""
+    mapid:        int
+    filename:     pathlib.Path
+    data_version: int
+    key:          MapKey  # built once, as it's hashed and compared for duplicates
+    category:     str
+
+    # Tags read from a map file, by their path
+    FIELDS = frozenset(("DataVersion", "data.dimension", "data.xCenter", "data.zCenter",
+                        "data.unlimitedTracking", "data.scale"))
+
+    @property
+    def dimension(self) -> mc.Dimension:
+        return self.key.dimension
+
+    @property
+    def center(self) -> mc.FlatPos:
+        return self.key.center
+
+    @property
+    def is_player(self) -> bool:
+        return self.key.is_player
+
+    @property
+    def scale(self) -> int:
+        return self.key.scale
+
+    @classmethod
+    def load(cls, filename: mc.AnyPath) -> 'MapSummary':
+        """Read only the needed tags, skipping the NBT parsing of a full Map load.
+
+        Most of a map file is its 16K 'data.colors' pixels and lists of banners and
+        frames, all jumped over by their length without ever being parsed.
+        """
+        with open(filename, 'rb') as fd:
+            fields = scan_nbt_fields(gzip.decompress(fd.read()), cls.FIELDS)
+        try:
+            key = MapKey(
+                dimension = Map.dim_map[fields["data.dimension"]],
+                center    = mc.FlatPos(fields["data.xCenter"], fields["data.zCenter"]),
+                is_player = fields["data.unlimitedTracking"] == 0,
+                scale     = fields["data.scale"],
+            )
+        except KeyError as e:
+            raise mc.MCError(f"Invalid map file {filename}: missing or unknown {e}")
+        return cls(
+            mapid        = Map.id_from_path(filename),
+            filename     = pathlib.Path(filename),
+            data_version = fields.get("DataVersion", 0),  # Maps before 1.13 have none
+            key          = key,
+            category     = Map.get_category(key),
+        )
+
+    __repr__ = __str__ = Map.__repr__
+
+
+# Index and value in 'data.colors' of each pixel, as arrays of fields, not Python tuples
+MAP_PIXEL = np.dtype([('index', np.intp), ('value', np.int8)])
+MapPixels: 't.TypeAlias' = np.ndarray  # of MAP_PIXEL
 DiffValue: 't.TypeAlias' = t.Union[
     # Actual type depends on category
     None,       # missing key
@@ -364,6 +557,17 @@ DiffValue: 't.TypeAlias' = t.Union[
 ]
 
 
+class MapRef(t.NamedTuple):
+    """Location of a Map reference in World, a serializable subset of FQWorldTag"""
+    path:    str  # File path relative to World, as FQWorldTag.path
+    tagpath: str  # NBT Path to the 'map' tag in that file
+    file:    str  # level.dat or region file holding it, relative to World
+
+    @classmethod
+    def from_world_tag(cls, data: mc.FQWorldTag, file: str) -> 'MapRef':
+        return cls(str(data.path), str(data.fqtag.path[data.fqtag.key]), file)
+
+
 class TagDiff(t.NamedTuple):
     """Hold a single difference between a source and a target"""
     category: str         # Type of difference: missing, type, length or value
@@ -376,29 +580,261 @@ class TagDiff(t.NamedTuple):
 # -----------------------------------------------------------------------------
 # Auxiliary and Business logic functions
 
-def get_all_maps(world: str):
-    return Map.load_all(world=mc.load(world))
+@functools.lru_cache(maxsize=None)
+def load_world(world: str) -> mc.World:
+    """Load a World only once per run, so chained commands share it"""
+    return mc.load(world)
 
 
-def get_map_refs(world: mc.World) -> t.Tuple[t.Dict[int, t.List[mc.FQWorldTag]], bool]:
-    # Theoretically, tag type is mc.AnyTag, but as we're filtering name == "map",
-    # then we know it'll only be mc.Int, as tag == mapid
+@functools.lru_cache(maxsize=None)
+def get_all_maps(world: str) -> AllMaps:
+    """Summaries of all maps in World, as no command using them needs the pixels"""
+    return Map.load_all(world=load_world(world), summary=True)
+
+
+def print_maps(maps: t.Iterable[AnyMap], pretty=False) -> None:
+    if pretty:
+        pprint(list(maps))
+        return
+    # Map repr is a single line, so pprint() would only add overhead
+    sys.stdout.write("".join(f"{mapitem!r}\n" for mapitem in maps))
+
+
+def get_map_refs(
+    world: mc.World,
+    paths: t.Container[str] = None,
+    progress=False,
+) -> t.Tuple[t.Dict[int, t.List[mc.FQWorldTag]], bool]:
+    # Tag type is mc.AnyTag, as any tag could be named "map". References are the
+    # integer ones of any width, as tag == mapid, so skip others instead of failing
+    # on int()
     log.info("Searching Map references in %r, this might take a VERY long time...",
              world.name)
-    refs: t.Dict[int, t.List[mc.FQWorldTag]] = {}
+    refs: t.DefaultDict[int, t.List[mc.FQWorldTag]] = collections.defaultdict(list)
     aborted = False
+    debug = log.isEnabledFor(logging.DEBUG)
     try:
-        for data in world.walk(progress=(logging.getLogger().level == logging.INFO)):
+        for data in walk_map_tags(world, paths=paths, progress=progress):
             nbt = data.fqtag
-            if not nbt.key == 'map':
+            if not isinstance(nbt.tag, mc.NumericInteger):
+                if debug:
+                    log.debug("Not a Map reference: %s\t%s", data.path, nbt.path[nbt.key])
                 continue
-            refs.setdefault(int(nbt.tag), []).append(data)
-            log.debug("%s\t%s\t%s\t%r", data.path, nbt.path, nbt.key, nbt.tag)
+            refs[int(nbt.tag)].append(data)
+            if debug:
+                log.debug("%s\t%s\t%s\t%r", data.path, nbt.path, nbt.key, nbt.tag)
     except KeyboardInterrupt:
         aborted = True
     log.info("Map references found: %d",
              sum(len(_) for _ in refs.values()))
-    return refs, aborted
+    return dict(refs), aborted
+
+
+def walk_map_tags(
+    world: mc.World,
+    paths: t.Container[str] = None,
+    progress=False,
+) -> t.Iterator[mc.FQWorldTag]:
+    """Like World.walk(), but yield only tags named 'map'
+
+    Parsing a chunk into NBT tags is by far the slowest step, and most chunks have
+    no maps at all. So each region file is first read raw, and only chunks whose
+    uncompressed data contain a serialized 'map' tag name are parsed and walked.
+    Regions with no such chunks are never loaded.
+
+    If paths is given, only level.dat and region files in it are walked.
+    """
+    def relpath(*paths):
+        return pathlib.Path(*paths).relative_to(world.path)
+
+    if paths is None or world.level.filename in paths:
+        for data in walk_named(world.level, 'map', skip=NO_ITEMS_TAGS):
+            yield mc.FQWorldTag(
+                path  = relpath(world.level.filename),
+                obj   = world.level,
+                root  = world.level,
+                fqtag = data,
+            )
+
+    files = [_ for _ in get_region_files(world) if paths is None or _[2] in paths]
+    # Pre-screening is mostly zlib decompression, which releases the GIL, so threads
+    # screen the next regions while the current one is parsed. A process pool would
+    # not help parsing, as live tags can't be sent back from another process.
+    executor = concurrent.futures.ThreadPoolExecutor()
+    try:
+        screened = zip(files, executor.map(find_map_chunks, [_[2] for _ in files]))
+        for (regions, pos, path), chunks in (tqdm.tqdm(screened, total=len(files))
+                                             if progress else screened):
+            if not chunks:
+                continue
+            region: mc.RegionFile = regions[pos]
+            for chunk_pos in chunks:
+                if chunk_pos not in region:  # Could not be parsed by mcworldlib
+                    continue
+                chunk = region[chunk_pos]
+                fspath = relpath(region.filename,
+                                 f"c.{chunk.pos.filepart}@{chunk.world_pos.filepart}")
+                for data in walk_named(chunk, 'map', skip=NO_ITEMS_TAGS):
+                    yield mc.FQWorldTag(
+                        path  = fspath,
+                        obj   = region,
+                        root  = chunk,
+                        fqtag = data,
+                    )
+    finally:
+        # Don't wait for pending regions if walk was aborted
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def walk_named(
+    root: mc.AnyTag,
+    name: str,
+    skip: t.Container[mc.TagKey] = (),
+) -> t.Iterator[mc.FQTag]:
+    """Like mc.nbt.walk(), but yield only tags named name
+
+    Tags named as in skip are not walked into, wherever found. Walks with an
+    explicit stack instead of nested generators, and builds the NBT Path of a tag
+    only when it is yielded, while mc.deep_walk() builds one for every tag it walks.
+    """
+    def children(tag: mc.AnyTag) -> t.Iterator[t.Tuple[int, t.Tuple[mc.TagKey, mc.AnyTag]]]:
+        return enumerate(tag.items() if isinstance(tag, mc.Compound) else enumerate(tag))
+
+    if root.is_leaf:
+        return
+    # (keys, enumerated children, parent) of each container being walked
+    stack = [((), children(root), root)]
+    while stack:
+        keys, items, parent = stack[-1]
+        for idx, (key, tag) in items:
+            break
+        else:
+            stack.pop()
+            continue
+        container = not tag.is_leaf
+        # Same as mc.nbt.walk(): Arrays and Lists of anything but Compounds or
+        # Lists are leaves, as they can't hold named tags
+        collapsed = container and (key in skip or (
+            not isinstance(tag, (mc.List[mc.List], mc.List[mc.Compound]))
+            and isinstance(tag, (mc.Array, mc.List))))
+        if key == name:
+            yield mc.FQTag(
+                tag          = tag,
+                path         = functools.reduce(operator.getitem, keys, mc.Path()),
+                key          = key,
+                idx          = idx,
+                is_container = container,
+                is_collapsed = collapsed,
+                level        = len(keys),
+                parent       = parent,
+                root         = root,
+            )
+        if container and not collapsed:
+            stack.append((keys + (key,), children(tag), tag))
+
+
+def get_region_files(world: mc.World) -> t.List[t.Tuple[t.Any, mc.RegionPos, str]]:
+    """(Regions, position, path) of every region file in World, in walk order"""
+    return [(regions, pos, os.path.join(world.path, dimension.subfolder(), category,
+                                        f"r.{pos.rx}.{pos.rz}.mca"))
+            for dimension, categories in world.dimensions.items()
+            for category, regions in categories.items()
+            for pos in regions]
+
+
+def find_map_chunks(path: mc.AnyPath) -> t.List[t.Tuple[int, int]]:
+    """Positions of chunks in a region file whose data contain a 'map' tag name
+
+    Might have false positives, such as a 'map' tag in a String, but no false negatives.
+    https://minecraft.fandom.com/wiki/Region_file_format
+    """
+    chunks = []
+    with open(path, 'rb') as fd:
+        if os.fstat(fd.fileno()).st_size < 8192:  # No header, Minecraft leaves
+            return chunks                         # empty region files around
+        # Mapped, so each chunk is decompressed straight from the page cache,
+        # without first copying the whole file into a bytes object.
+        # No view of the map may outlive it, otherwise it can't be closed
+        with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as data, \
+                memoryview(data) as view:
+            locations = np.frombuffer(view, dtype='>u4', count=1024).tolist()
+            for index, location in enumerate(locations):
+                if not location:
+                    continue
+                offset = (location >> 8) * 4096  # 3-byte sector offset
+                try:
+                    length, compression = struct.unpack_from('>IB', view, offset)
+                    raw = CHUNK_DECOMPRESS[compression](view[offset + 5:offset + 4 + length])
+                except (struct.error, KeyError, zlib.error, OSError, EOFError):
+                    raw = MAP_TAG_NAME  # Invalid or external chunk, let mcworldlib deal with it
+                if MAP_TAG_NAME in raw:
+                    chunks.append((index % 32, index // 32))  # (cx, cz) in region
+    return chunks
+
+
+@functools.lru_cache(maxsize=None)
+def get_cached_map_refs(
+    world: mc.World,
+    progress=False,
+) -> t.Tuple[t.Dict[int, t.List[MapRef]], bool]:
+    """Map references as read-only MapRef locations, cached in the World folder
+
+    Cache is per file: only level.dat and region files whose modification time
+    or size changed since the cache was written are walked again. Partial
+    (aborted) scans are never cached. MapRef can't be used to update references,
+    use get_map_refs() for that, walking only the files in MapRef.file.
+    """
+    def relpath(path: mc.AnyPath) -> str:
+        return os.path.relpath(path, world.path)
+
+    cache = pathlib.Path(world.path, REFS_CACHE)
+    paths = [world.level.filename] + [_[2] for _ in get_region_files(world)]
+    # Nanoseconds and size, as float seconds alone would miss changes within the
+    # timestamp granularity of some filesystems, or by tools preserving it.
+    # Lists, not tuples, so they compare equal to their JSON round-trip
+    stats: t.Dict[str, t.List[int]] = {}
+    for path in paths:
+        st = os.stat(path)
+        stats[relpath(path)] = [st.st_mtime_ns, st.st_size]
+    # {relpath: [[mtime_ns, size], {mapid: [MapRef, ...]}]}, mapid as str as it's JSON
+    files: t.Dict[str, t.List[t.Any]] = {}
+    try:
+        with open(cache) as fd:
+            files = {path: [stat, {mapid: [MapRef(*ref) for ref in refs]
+                                   for mapid, refs in file_refs.items()}]
+                     for path, (stat, file_refs) in json.load(fd).items()
+                     if stats.get(path) == stat}
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, TypeError) as e:
+        log.warning("Ignoring invalid Map references cache %s: %s", cache, e)
+
+    partial = False
+    stale = [path for path in stats if path not in files]
+    log.info("Map references cached for %d of %d files", len(stats) - len(stale), len(stats))
+    if stale:
+        files.update((path, [stats[path], {}]) for path in stale)
+        world_refs, partial = get_map_refs(
+            world, paths={os.path.join(world.path, path) for path in stale}, progress=progress
+        )
+        for mapid, datas in world_refs.items():
+            for data in datas:
+                file = relpath(data.obj.filename)
+                files[file][1].setdefault(str(mapid), []).append(
+                    MapRef.from_world_tag(data, file))
+        if not partial:
+            try:
+                with open(cache, 'w') as fd:
+                    json.dump(files, fd)
+            except OSError as e:
+                log.warning("Could not save Map references cache %s: %s", cache, e)
+
+    # Merge in walk order, level.dat then regions
+    refs: t.Dict[int, t.List[MapRef]] = {}
+    for path in stats:
+        for mapid, file_refs in files[path][1].items():
+            refs.setdefault(int(mapid), []).extend(file_refs)
+    return refs, partial
 
 
 def merge_map(source: Map, target: Map):
@@ -409,82 +845,119 @@ def merge_map(source: Map, target: Map):
         assert source == target
         return
 
-    if not changes:
+    if not len(changes):
         log.info("%s differences from %s, but no changes required in %s",
                  diffs, source.mapid, target.mapid)
-        assert not any(source[mc.Path("data.colors")])
+        assert not any(source[COLORS_PATH])
         return
 
     log.info("%s differences from %s, %s changes required in %s: %s",
-             diffs, len(changes), source.mapid, target.mapid, pformat(changes))
+             diffs, len(changes), source.mapid, target.mapid, changes)
     apply_pixels(target, changes)
     assert len(get_pixels_to_apply(source, target)[0]) == 0
     target.save()
 
 
 def get_map_diffs(source: Map, target: Map) -> t.Iterator[TagDiff]:
-    def evaluate(data: mc.FQTag) -> t.Tuple[str, DiffValue, DiffValue]:
-        src = data.tag  # source
-        if data.path[data.key] not in target:
-            # If container, should prune its whole subtree
-            return "missing", None, None
-        tag = target[data.path][data.key]  # target
-        if not type(tag) == type(src):
-            return "type", type(src), type(tag)
-        if data.is_container:
-            if not len(tag) == len(src):
-                return "length", len(src), len(tag)
+    """Differences from source to target, by walking all tags in source
+
+    'data.colors' is compared as a whole (type and length), not pixel by pixel.
+    """
+    def children(tag: mc.AnyTag) -> t.Iterator[t.Tuple[mc.TagKey, mc.AnyTag]]:
+        return iter(tag.items()) if isinstance(tag, mc.Compound) else enumerate(tag)
+
+    def get_child(parent: t.Optional[mc.AnyTag], key: mc.TagKey) -> t.Optional[mc.AnyTag]:
+        if isinstance(parent, mc.Compound):
+            return parent.get(key) if isinstance(key, str) else None
+        if isinstance(key, int) and parent is not None and not parent.is_leaf:
+            return parent[key] if key < len(parent) else None
+        return None
+
+    if source is target:
+        return
+    # Walking into colors would evaluate each of its 16K pixels as a tag,
+    # so do not recur into it and compare the whole array at once instead
+    colors = source.data.get('colors')
+    # Same depth-first order as mc.deep_walk(), but with an explicit stack of
+    # (keys, source children, target container) instead of nested generators,
+    # and each target tag taken from its parent instead of by NBT Path from root.
+    # A None target container is missing, and so are all of its children.
+    stack = [((), children(source), target)]
+    while stack:
+        keys, items, parent = stack[-1]
+        for key, src in items:
+            break
         else:
-            if not tag == src:
-                return "value", src, tag
-        return "", None, None
-    for full_tag in mc.deep_walk(source):
-        category, source_value, target_value = evaluate(full_tag)
+            stack.pop()
+            continue
+        tag = get_child(parent, key)
+        container = not src.is_leaf
+        category: str = ""
+        source_value: DiffValue = None
+        target_value: DiffValue = None
+        if tag is None:
+            category = "missing"
+        elif type(tag) is not type(src):
+            category, source_value, target_value = "type", type(src), type(tag)
+        elif container:
+            if len(tag) != len(src):
+                category, source_value, target_value = "length", len(src), len(tag)
+        elif tag != src:
+            category, source_value, target_value = "value", src, tag
         if category:
             yield TagDiff(
                 category = category,
-                path     = full_tag.path,
-                key      = full_tag.key,
+                path     = functools.reduce(operator.getitem, keys, mc.Path()),
+                key      = key,
                 source   = source_value,
                 target   = target_value,
             )
+        if container and src is not colors:
+            stack.append((keys + (key,), children(src), tag))
 
 
-def can_merge(source: Map, target: Map) -> t.Tuple[bool, t.List[MapPixel]]:
+def can_merge(source: Map, target: Map) -> t.Tuple[bool, MapPixels]:
     try:
         return True, get_pixels_to_apply(source, target)[0]
     except mc.MCError as e:
         log.info(e)  # debug
-        return False, []
+        return False, np.empty(0, dtype=MAP_PIXEL)
 
 
-def get_pixels_to_apply(source: Map, target: Map) -> t.Tuple[t.List[MapPixel], int]:
+def get_pixels_to_apply(source: Map, target: Map) -> t.Tuple[MapPixels, int]:
     i = 0
-    pixels: t.List[MapPixel] = []
     for i, diff in enumerate(get_map_diffs(source, target), 1):
-        if not diff.category == "value":
+        if diff.category != "value":
             raise mc.MCError("Maps %s and %s can't be merged: %s",
                              source.mapid, target.mapid, diff)
 
-        if diff.path[diff.key] == mc.Path("DataVersion"):
-            if not diff.target >= diff.source:
+        if (diff.path, diff.key) == DATA_VERSION_KEY:  # no Path built per diff
+            if diff.target < diff.source:
                 raise mc.MCError("Maps %s and %s can't be merged, target DataVersion"
                                  " must be at least equal to source's: %s < %s [%s",
                                  source.mapid, target.mapid, diff.source, diff.target, diff)
             continue
 
-        if not diff.path == mc.Path("data.colors"):
+        if diff.path != COLORS_PATH:
             raise mc.MCError("Maps %s and %s can't be merged, they must diverge"
                              " only on colors data: %s",
                              source.mapid, target.mapid, diff)
 
-        if diff.source and not diff.target:
-            pixels.append((diff.key, diff.source))
+    if 'colors' not in source.data:
+        return np.empty(0, dtype=MAP_PIXEL), i
 
-    return pixels, i
+    # Colors have same type and length, otherwise it would have raised above.
+    src, tgt = np.asarray(source.data['colors']), np.asarray(target.data['colors'])
+    if src.tobytes() == tgt.tobytes():  # a single memcmp(), the common case for dupes
+        return np.empty(0, dtype=MAP_PIXEL), i
+    # Apply pixels that are non-blank in source and blank in target
+    idx = np.flatnonzero((src != 0) & (tgt == 0))
+    pixels: MapPixels = np.empty(idx.size, dtype=MAP_PIXEL)
+    pixels['index'], pixels['value'] = idx, src[idx]
+    return pixels, i + np.count_nonzero(src != tgt)
 
 
-def apply_pixels(target: Map, pixels: t.Iterable[MapPixel]) -> None:
+def apply_pixels(target: Map, pixels: MapPixels) -> None:
     arr = target.data['colors']
     # NBT Arrays might be implemented by the NBT backend as read-only ndarray views
     # If so, set the pixels in a (writeable) copy, then write back preserving original type
@@ -492,26 +965,96 @@ def apply_pixels(target: Map, pixels: t.Iterable[MapPixel]) -> None:
     if isinstance(arr, np.ndarray) and not arr.flags.writeable:
         cls = arr.__class__
         arr = arr.copy()
-    for pixel in pixels:
-        arr[pixel[0]] = pixel[1]
+    if isinstance(arr, np.ndarray):
+        # A single scatter instead of a Python-level assignment per pixel
+        arr[pixels['index']] = pixels['value']
+    else:
+        for index, value in pixels.tolist():
+            arr[index] = value
     if cls:
         target.data['colors'] = cls(arr)
 
 
-def get_duplicates(all_maps: t.Dict[int, Map]) -> t.Iterator[t.Tuple[MapKey, t.List[Map]]]:
-    map_dupes: t.Dict[MapKey, t.List[Map]] = {}
+def get_duplicates(all_maps: t.Dict[int, AnyMap]) -> t.Iterator[t.Tuple[MapKey, t.List[AnyMap]]]:
+    # Most maps are unique, so start a list for a key only at its second map
+    firsts: t.Dict[MapKey, AnyMap] = {}
+    map_dupes: t.Dict[MapKey, t.List[AnyMap]] = {}
     for mapitem in all_maps.values():
-        map_dupes.setdefault(mapitem.key, []).append(mapitem)
-    for key, dupes in map_dupes.items():
-        if len(dupes) > 1:
-            yield key, dupes
+        key = mapitem.key
+        first = firsts.setdefault(key, mapitem)
+        if first is not mapitem:
+            if key in map_dupes:
+                map_dupes[key].append(mapitem)
+            else:
+                map_dupes[key] = [first, mapitem]
+    for key in firsts:  # in order of each key's first map, as before
+        if key in map_dupes:
+            yield key, map_dupes[key]
+
+
+def scan_nbt_fields(buf: bytes, paths: t.AbstractSet[str]) -> t.Dict[str, t.Any]:
+    """Values of the scalar and String tags at paths in an uncompressed NBT buffer
+
+    Paths are dotted names of root tags or of tags in compounds nested on them,
+    as 'DataVersion' or 'data.scale'. Only compounds leading to a path are walked,
+    every other tag is skipped by its length. Missing tags are not in the result.
+    """
+    fields: t.Dict[str, t.Any] = {}
+    prefixes = {path.rpartition('.')[0] + '.' for path in paths if '.' in path}
+
+    def skip(pos: int, tagid: int) -> int:
+        if tagid in NBT_SCALARS:
+            return pos + NBT_SCALARS[tagid].size
+        if tagid in NBT_ARRAYS:
+            return pos + NBT_LENGTH.size + NBT_ARRAYS[tagid] * NBT_LENGTH.unpack_from(buf, pos)[0]
+        if tagid == 8:  # String
+            return pos + NBT_STRLEN.size + NBT_STRLEN.unpack_from(buf, pos)[0]
+        if tagid == 9:  # List
+            itemid, length = buf[pos], NBT_LENGTH.unpack_from(buf, pos + 1)[0]
+            pos += 1 + NBT_LENGTH.size
+            if itemid in NBT_SCALARS:
+                return pos + length * NBT_SCALARS[itemid].size
+            for _ in range(length):
+                pos = skip(pos, itemid)
+            return pos
+        if tagid == 10:  # Compound
+            return walk(pos, None)
+        raise mc.MCError(f"Invalid NBT tag ID {tagid} at offset {pos}")
+
+    def walk(pos: int, prefix: t.Optional[str]) -> int:
+        # Walk a compound payload, reading its tags if prefix is set
+        while True:
+            tagid = buf[pos]
+            if not tagid:  # End
+                return pos + 1
+            namelen = NBT_STRLEN.unpack_from(buf, pos + 1)[0]
+            pos += 1 + NBT_STRLEN.size
+            name = buf[pos:pos + namelen].decode()
+            pos += namelen
+            path = None if prefix is None else prefix + name
+            if path in paths and tagid in NBT_SCALARS:
+                fields[path] = NBT_SCALARS[tagid].unpack_from(buf, pos)[0]
+            elif path in paths and tagid == 8:
+                length = NBT_STRLEN.unpack_from(buf, pos)[0]
+                start = pos + NBT_STRLEN.size
+                fields[path] = buf[start:start + length].decode()
+            elif tagid == 10 and path is not None and path + '.' in prefixes:
+                pos = walk(pos, path + '.')
+                continue
+            pos = skip(pos, tagid)
+
+    if buf[0] != 10:
+        raise mc.MCError("NBT root is not a Compound")
+    walk(1 + NBT_STRLEN.size + NBT_STRLEN.unpack_from(buf, 1)[0], "")
+    return fields
 
 
 def defrag_maps(
     world: mc.World,
     all_maps: t.Dict[int, Map] = None,
     all_refs: t.Dict[int, t.List[mc.FQWorldTag]] = None,
-    partial_refs: bool = True
+    partial_refs: bool = True,
+    progress=False,
 ):
     """Move map files to missing IDs and update idcounts.dat, updating World references
         - Find all missing map files according to idcounts.dat
@@ -532,7 +1075,17 @@ def defrag_maps(
         return
 
     # Update references
-    refs, partial = get_map_refs(world) if all_refs is None else (all_refs, partial_refs)
+    if all_refs is None:
+        # Only files holding references to shifted maps need walking for their tags
+        map_refs, partial_refs = get_cached_map_refs(world, progress=progress)
+        paths = {os.path.join(world.path, ref.file)
+                 for mapid in shift for ref in map_refs.get(mapid, ())}
+        if paths:
+            all_refs, partial = get_map_refs(world, paths=paths, progress=progress)
+            partial_refs = partial_refs or partial
+        else:
+            all_refs = {}  # Nothing to walk, and no empty thread pool to start
+    refs, partial = all_refs, partial_refs
     if partial:
         log.warning("World scanning aborted, changes will not be applied")
     files: t.Dict[mc.AnyPath, t.Union[mc.RegionFile, mc.Level]] = {}
@@ -552,7 +1105,6 @@ def defrag_maps(
                 parent[key] = value.__class__(target)  # mc.Int(target)
 
     # Save changed regions
-    # log.info("Files to save:\n%s", "\n\t".join(repr(_) for _ in files.items()))
     for filename, obj in files.items():
         log.info("Saving file %r: %r", filename, obj)
         if not partial:
@@ -571,7 +1123,7 @@ def defrag_maps(
 
 def update_idcounts(world, mapid, partial=False, **kw):
     if isinstance(world, str):
-        world = mc.load(world)
+        world = load_world(world)
     idcounts = mc.load_dat(pathlib.Path(world.path).joinpath('data/idcounts.dat'))
     maxid_path = mc.Path("data.map")
     old_maxid = idcounts[maxid_path]